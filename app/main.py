@@ -9,44 +9,64 @@ from kivy.uix.gridlayout import GridLayout
 from kivy.uix.button import Button
 from kivy.uix.label import Label
 from kivy.uix.popup import Popup
-from kivy.uix.togglebutton import ToggleButton
 from kivy.uix.widget import Widget
 from kivy.lang import Builder
+from kivy.factory import Factory
 from kivy.uix.screenmanager import ScreenManager, Screen
 from kivy.properties import ObjectProperty
+from kivy.graphics import Color, Rectangle
+from kivy.graphics.texture import Texture
 import kivy.clock
 
 import webbrowser
+import logging
 import pathlib
 import threading
-from schedule import Schedule
+import multiprocessing
+import os
+import matplotlib
+# figures are rendered by Agg and displayed by Kivy, pyplot GUI backends are not used
+matplotlib.use('Agg')
+from schedule import Schedule, LessonType, simulated_annealing_replicas
 import time
-import glob
 import copy
 
 import numpy as np
-from kivy.garden.matplotlib import FigureCanvasKivyAgg
-import matplotlib.pyplot as plt
-#matplotlib.use('module://kivy.garden.matplotlib.backend_kivy')
-import pandas as pd
-
-
-try:
-    client_file = glob.glob('../client_data/*.csv')[0]
-# When ther is no such file the list is empty and we get index error,
-# which we try to capture
-except IndexError:
-    client_file = str()
-
-try:
-    instructor_file = glob.glob('../instructor_data/*.csv')[0]
-# When ther is no such file the list is empty and we get index error,
-# which we try to capture
-except IndexError:
-    instructor_file = str()
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+log = logging.getLogger(__name__)
+
+# root directory of the project, resolved once
+APP_ROOT = pathlib.Path(__file__).parent.parent.resolve()
+
+
+def first_csv(directory):
+    # returns path of the first *.csv file in the directory or empty string if there is no such file
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith('.csv'):
+                    return entry.path
+    # When there is no such directory, the file is not chosen
+    except FileNotFoundError:
+        pass
+    return str()
+
+
+client_file = first_csv('../client_data')
+instructor_file = first_csv('../instructor_data')
+
+
+def lesson_type_to_text(lesson_type):
+    # convert "LessonType.ZUMBA_ADVANCED" to user friendly "ZUMBA ADVANCED "
+    return ' '.join(lesson_type.name.split('_')) + ' '
+
+
+# texts displayed for lesson types are computed only once
+lesson_type_texts = {lesson_type: lesson_type_to_text(lesson_type) for lesson_type in LessonType}
 
 # global variable
-schedule_global = None
 initial_solution = None
 
 
@@ -59,15 +79,16 @@ class Optimize(Screen):
     first_cost = float()
     second_cost = float()
     third_cost = float()
-    all_costs = list()
     num_of_iter = int()
     clients_num = int()
     instructors_num = int()
     SM = None
+    running = BooleanProperty(False)
+
     def __init__(self, **kw):
         super().__init__(**kw)
         self.parameters = {
-            'neighborhood_type_lst': ['move_one'],
+            'neighborhood_type_set': {'move_one'},
             # parameter unused by end user, moved to function call
             # 'initial_solution': False,
             'alpha': 0.999,
@@ -80,7 +101,13 @@ class Optimize(Screen):
             'improve_results': True,
             'penalty_for_repeated': 250,
             'penalty_for_unmatched': 100,
-            'use_penalty_method': False}
+            'use_penalty_method': False,
+            'cool_opt': 'ExpMult',
+            'n_processes': os.cpu_count() or 1}
+        # event used to stop running optimization
+        self._stop_event = None
+        # costs of the chain kept by the last optimization
+        self.all_costs = np.empty(0)
 
     def checkbox_greedy(self, instance, value):
         if value is True:
@@ -96,9 +123,9 @@ class Optimize(Screen):
 
     def checkbox_click(self, instance, value, neighborhood_type):
         if value is True:
-            self.parameters['neighborhood_type_lst'].append(neighborhood_type)
+            self.parameters['neighborhood_type_set'].add(neighborhood_type)
         else:
-            self.parameters['neighborhood_type_lst'].remove(neighborhood_type)
+            self.parameters['neighborhood_type_set'].discard(neighborhood_type)
 
     def toggle_penalty_method(self, instance):
         if instance.state == 'down':
@@ -125,10 +152,10 @@ class Optimize(Screen):
         self.manager.get_screen('see_algorithm_parameters').ids.alg_time.text = str(format(Optimize.alg_time, '.2f')) + " s"
 
     def generate_initial_solution(self, force=False):
-        global schedule_global
         global initial_solution
-        if schedule_global is None or force is True:
-            schedule_global = Schedule(client_file=client_file,
+        app = App.get_running_app()
+        if app.schedule is None or force is True:
+            schedule = Schedule(client_file=client_file,
                           instructor_file=instructor_file,
                           class_num=ScheduleParameters.schedule_parameters['class_num'],
                           day_num=ScheduleParameters.schedule_parameters['day_num'],
@@ -142,60 +169,110 @@ class Optimize(Screen):
                           penalty_for_repeated=self.parameters['penalty_for_repeated'],
                           penalty_for_unmatched=self.parameters['penalty_for_unmatched'])
 
-            schedule_global.generate_random_schedule(greedy=self.parameters['greedy'])
-            Optimize.clients_num = pd.read_csv(client_file, sep=";").shape[0]
-            Optimize.instructors_num = pd.read_csv(instructor_file, sep=";").shape[0]
-            initial_solution = copy.deepcopy(schedule_global)
+            schedule.generate_random_schedule(greedy=self.parameters['greedy'])
+            schedule.update_classroom_views()
+            Optimize.clients_num = schedule.clients.shape[0]
+            Optimize.instructors_num = schedule.instructors.shape[0]
+            initial_solution = copy.deepcopy(schedule)
+            app.schedule = schedule
 
     def start_optimization(self):
-        global schedule_global
+        # ignore the request if the previous optimization is still running
+        if self.running:
+            return
         self.generate_initial_solution()
-        SM = schedule_global
-        print("\nINITIAL SCHEDULE")
-        print(self.parameters['use_penalty_method'], self.parameters['neighborhood_type_lst'])
-        print(SM)
-        print('Initial earnings: ', SM.get_cost())
+        self.running = True
+        self._stop_event = multiprocessing.Event()
+        # simulated annealing is executed in a separate thread to keep GUI responsive
+        threading.Thread(target=self._run_sa, args=(App.get_running_app().schedule,), daemon=True).start()
+
+    def cancel_optimization(self):
+        # chains are stopped after the current temperature level (up to KERNEL_TEMP_STEPS levels
+        # with the compiled kernel) and keep the best solutions found so far
+        if self.running and self._stop_event is not None:
+            self._stop_event.set()
+
+    def _run_sa(self, SM):
+        try:
+            self._optimize(SM)
+        except Exception as error:
+            log.exception("Optimization failed")
+            message = f"{type(error).__name__}: {error}"
+            # GUI is unlocked and the error is shown in the Kivy thread
+            kivy.clock.Clock.schedule_once(lambda dt: self._fail(message))
+
+    def _optimize(self, SM):
         first_cost = SM.get_cost()
-        Optimize.first_cost = first_cost
+        # sorted to pass neighborhood types in the same order regardless of clicking order
+        neighborhood_type_lst = sorted(self.parameters['neighborhood_type_set'])
+        log.info("Penalty method: %s, neighborhood types: %s",
+                 self.parameters['use_penalty_method'], neighborhood_type_lst)
+        # schedule is converted to string only if debug messages are logged
+        log.debug("INITIAL SCHEDULE%s", SM)
+        log.info("Initial earnings: %s", first_cost)
 
         tic = time.time()
 
-        best_cost, num_of_iter, all_costs = SM.simulated_annealing(alpha=self.parameters['alpha'],
-                                                                   initial_temp=self.parameters['initial_temp'],
-                                                                   n_iter_one_temp=self.parameters['n_iter_one_temp'],
-                                                                   min_temp=self.parameters['min_temp'],
-                                                                   epsilon=self.parameters['epsilon'],
-                                                                   n_iter_without_improvement=self.parameters['n_iter_without_improvement'],
-                                                                   initial_solution=True,
-                                                                   neighborhood_type_lst=self.parameters['neighborhood_type_lst'])
+        sa_parameters = {'alpha': self.parameters['alpha'],
+                         'initial_temp': self.parameters['initial_temp'],
+                         'n_iter_one_temp': self.parameters['n_iter_one_temp'],
+                         'min_temp': self.parameters['min_temp'],
+                         'epsilon': self.parameters['epsilon'],
+                         'n_iter_without_improvement': self.parameters['n_iter_without_improvement'],
+                         'initial_solution': True,
+                         'neighborhood_type_lst': neighborhood_type_lst,
+                         'cool_opt': self.parameters['cool_opt']}
 
-        Optimize.all_costs = all_costs
-        Optimize.num_of_iter = num_of_iter
-        toc = time.time()
+        # independent chains start from the same initial solution, the one with the highest earnings is kept
+        best_cost, SM, num_of_iter, all_costs = simulated_annealing_replicas(
+            SM, self.parameters['n_processes'], self._stop_event, **sa_parameters)
 
-        Optimize.alg_time = toc - tic
+        toc = time.time()
+        alg_time = toc - tic
 
-        print("\nAFTER OPTIMIZATION")
-        print(SM)
-        print("Number of iterations: ", num_of_iter)
+        log.debug("AFTER OPTIMIZATION%s", SM)
+        log.info("Number of iterations: %s", num_of_iter)
 
-        print("Best earnings: ", best_cost)
+        log.info("Best earnings: %s", best_cost)
         second_cost = best_cost
-        Optimize.second_cost = second_cost
-        print("Time: ", toc - tic)
+        log.info("Time: %s", alg_time)
 
+        third_cost = Optimize.third_cost
         if self.parameters['improve_results']:
             SM.improve_results()
-            print("\nIMPROVED SCHEDULE")
-            print(SM)
-            print("Best improved earnings: ", SM.get_cost())
-
             third_cost = SM.get_cost()
-            print(f'{first_cost} $ --> {second_cost} $ --> {third_cost} $')
-            Optimize.third_cost = third_cost
+            log.debug("IMPROVED SCHEDULE%s", SM)
+            log.info("Best improved earnings: %s", third_cost)
+            log.info("%s $ --> %s $ --> %s $", first_cost, second_cost, third_cost)
         else:
-            print(f'{first_cost} $ --> {second_cost} $')
+            log.info("%s $ --> %s $", first_cost, second_cost)
 
+        # results are published in the Kivy thread
+        kivy.clock.Clock.schedule_once(lambda dt: self._finish(SM, first_cost, second_cost, third_cost,
+                                                               num_of_iter, all_costs, alg_time))
+
+    def _finish(self, SM, first_cost, second_cost, third_cost, num_of_iter, all_costs, alg_time):
+        SM.update_classroom_views()
+        App.get_running_app().schedule = SM
+        Optimize.first_cost = first_cost
+        Optimize.second_cost = second_cost
+        Optimize.third_cost = third_cost
+        self.all_costs = all_costs
+        Optimize.num_of_iter = num_of_iter
+        Optimize.alg_time = alg_time
+        self.update_algorithm_parameters()
+        self.running = False
+
+    def _fail(self, message):
+        self.running = False
+        error_popup = Popup(title="Error", size_hint=(None, None), size=(300, 200), auto_dismiss=False)
+        error_popup_content = BoxLayout(orientation="vertical")
+        error_popup_content.add_widget(
+            Label(size=(cm(6), cm(4)), pos_hint={'top': 1}, text_size=(cm(6), cm(4)), font_size='20sp',
+                  text=f'Optimization failed - {message}', halign='center', valign='center'))
+        error_popup_content.add_widget(Button(text='Close', size_hint=(1, 0.2), on_press=error_popup.dismiss))
+        error_popup.content = error_popup_content
+        error_popup.open()
 
 
 class ScheduleOptions(Screen):
@@ -204,7 +281,7 @@ class ScheduleOptions(Screen):
 
 class ClientFileChooser(Screen):
     def get_path(self):
-        return str(pathlib.Path(__file__).parent.parent.resolve()) + r'\client_data'
+        return str(APP_ROOT / 'client_data')
 
     def selected(self, filename):
         global client_file
@@ -217,7 +294,7 @@ class ClientFileChooser(Screen):
 
 class InstructorFileChooser(Screen):
     def get_path(self):
-        return str(pathlib.Path(__file__).parent.parent.resolve()) + r'\instructor_data'
+        return str(APP_ROOT / 'instructor_data')
 
     def selected(self, filename):
         global instructor_file
@@ -244,18 +321,18 @@ class ScheduleParameters(Screen):
             ScheduleParameters.schedule_parameters[parameter] = int(input_parameter)
         except ValueError:
             ScheduleParameters.schedule_parameters[parameter] = 0
-        global schedule_global
+        schedule = App.get_running_app().schedule
 
-        if schedule_global is not None:
-            setattr(schedule_global, parameter, ScheduleParameters.schedule_parameters[parameter])
+        if schedule is not None:
+            setattr(schedule, parameter, ScheduleParameters.schedule_parameters[parameter])
             setattr(initial_solution, parameter, ScheduleParameters.schedule_parameters[parameter])
 
-        print(ScheduleParameters.schedule_parameters['ticket_cost'])
+        log.debug("Schedule parameter %s set to %s", parameter, ScheduleParameters.schedule_parameters[parameter])
 
     def update_text_input_fields(self):
-        global schedule_global
+        schedule = App.get_running_app().schedule
         for parameter in ScheduleParameters.schedule_parameters:
-            self.ids[parameter].text = str(getattr(schedule_global, parameter))
+            self.ids[parameter].text = str(getattr(schedule, parameter))
 
 class AboutOrganizer(Screen):
     def github_button_on(self):
@@ -265,20 +342,51 @@ class AboutOrganizer(Screen):
         self.ids.github_button_img.source = 'images/GitHub-Mark-Light-120px-plus.png'
         webbrowser.open('https://github.com/kmotyka00/ScheduleOptimizationProblem')
 
-# Functions to enable assignment
-# self.font_size: self.width / 8
-def set_font_size(font_size_divider, *args, **kwargs):
-    def wrap(instance, value, *args, **kwargs):
-        instance.font_size = value / font_size_divider
-    return wrap
+def downsample_costs(costs, target=2000):
+    """
+    Reduces number of plotted points, so it is comparable with the width of the plot in pixels.
+
+    Costs are divided into target / 2 buckets and the minimum and maximum of each bucket
+    are kept, which preserves the envelope of the goal function.
+
+    Returns
+    -------
+    tuple
+        Tuple (x, y) of the points to plot.
+    """
+    costs = np.asarray(costs, dtype=np.float64)
+    if costs.size <= target:
+        return np.arange(costs.size), costs
+    bucket_starts = np.unique(np.linspace(0, costs.size, target // 2, endpoint=False).astype(int))
+    x = np.repeat(bucket_starts, 2)
+    y = np.column_stack((np.minimum.reduceat(costs, bucket_starts),
+                         np.maximum.reduceat(costs, bucket_starts))).ravel()
+    return x, y
 
-# self.text_size: self.size
-def set_text_size(instance, value):
-    instance.text_size = value
 
 class SeeSchedule(Screen):
     classroom_displayed = 0
 
+    def __init__(self, **kw):
+        super().__init__(**kw)
+        # buttons of the schedule layout in order of time slots
+        self._button_refs = list()
+        # popups are created on the first use
+        self._lesson_popup = None
+        self._lesson_label = None
+        self._classroom_popup = None
+        self._classroom_popup_class_num = None
+        App.get_running_app().bind(schedule=self._on_schedule)
+
+    def _on_schedule(self, instance, value):
+        # refresh displayed schedule when a new one is published
+        if value is not None and self._button_refs:
+            # new schedule may have fewer classrooms than the displayed one
+            if SeeSchedule.classroom_displayed >= len(value.classroom_views):
+                SeeSchedule.classroom_displayed = 0
+                self.ids['change_class_button'].text = "Displayed classroom id: 0"
+            self.update_schedule_description()
+
     def chceck_content(self, instance):
         # Lesson Content Popup
         if instance.ids['lesson'] is not None:
@@ -289,17 +397,17 @@ class SeeSchedule(Screen):
                              f"\n\nParticipants: {participants}"
         else:
             lesson_content = "That's a FREE REAL ESTATE"
-        lesson_content_popup = Popup(title=f'Lesson information')
-        popup_content = BoxLayout(orientation="vertical")
-        label = Label(text=lesson_content, halign='center', valign='center')
-        # self.font_size: self.width / 8
-        label.bind(width=set_font_size(50))
-        # self.text_size: self.size
-        label.bind(size=set_text_size)
-        popup_content.add_widget(label)
-        popup_content.add_widget(Button(text='Close', size_hint=(1, 0.2), on_press=lesson_content_popup.dismiss))
-        lesson_content_popup.content = popup_content
-        return lesson_content_popup.open()
+        # popup is created on the first use and then only its text is changed
+        if self._lesson_popup is None:
+            self._lesson_popup = Popup(title=f'Lesson information')
+            popup_content = BoxLayout(orientation="vertical")
+            # font and text sizes are set by the rule in new_window.kv
+            self._lesson_label = Factory.LessonContentLabel()
+            popup_content.add_widget(self._lesson_label)
+            popup_content.add_widget(Button(text='Close', size_hint=(1, 0.2), on_press=self._lesson_popup.dismiss))
+            self._lesson_popup.content = popup_content
+        self._lesson_label.text = lesson_content
+        return self._lesson_popup.open()
 
     def generate_see_schedule_layout(self):
         # order is important, because it affects order of elements in GUI
@@ -311,64 +419,59 @@ class SeeSchedule(Screen):
             self.genrate_days_layout()
 
     def generate_schedule_layout(self):
-        schedule_layout = GridLayout(cols=ScheduleParameters.schedule_parameters['day_num'], size_hint=(0.86, 1))
-        for time_slot in range(ScheduleParameters.schedule_parameters['day_num']
-                               * ScheduleParameters.schedule_parameters['time_slot_num']):
-            if f'Button{time_slot}' not in self.ids.keys():
-                button = Button(text=f'{None}', halign='center', valign='center')
-                button.background_normal = ''
+        day_num = ScheduleParameters.schedule_parameters['day_num']
+        time_slot_num = ScheduleParameters.schedule_parameters['time_slot_num']
+        ids = self.ids
+        # layout is filled before it is attached to bottom_part, so adding buttons
+        # only schedules a single layout pass instead of relayouting visible widgets
+        schedule_layout = GridLayout(cols=day_num, size_hint=(0.86, 1))
+        for time_slot in range(day_num * time_slot_num):
+            if f'Button{time_slot}' not in ids:
+                # font and text sizes are set by the rule in new_window.kv
+                button = Factory.ScheduleCellButton(text=f'{None}')
                 if time_slot % 2 == 0:
                     button.background_color = [.8, .8, .9, .6]
                 else:
                     button.background_color = [.8, .8, .9, .8]
-                # self.font_size: self.width / 8
-                button.bind(width=set_font_size(8))
-                # self.text_size: self.size
-                button.bind(size=set_text_size)
                 button.bind(on_press=self.chceck_content)
                 button.ids['lesson'] = None
                 button.ids['lesson_time_slot'] = None
                 schedule_layout.add_widget(button)
-                self.ids[f'Button{time_slot}'] = button
-        self.ids.bottom_part.ids[f'schedule_layout'] = schedule_layout
-        self.ids.bottom_part.add_widget(schedule_layout)
+                ids[f'Button{time_slot}'] = button
+        ids.bottom_part.ids[f'schedule_layout'] = schedule_layout
+        ids.bottom_part.add_widget(schedule_layout)
+        self._button_refs = [ids[f'Button{time_slot}'] for time_slot in range(day_num * time_slot_num)]
 
     def genrate_hours_layout(self):
-        hours_layout = GridLayout(rows=ScheduleParameters.schedule_parameters['time_slot_num'], size_hint=(0.14, 1))
-        for time_slot in range(ScheduleParameters.schedule_parameters['time_slot_num']):
-            if f'Button_hours{time_slot}' not in self.ids.keys():
-                button = Button(text=f'{time_slot}', halign='center', valign='center')
-                button.background_normal = ''
+        time_slot_num = ScheduleParameters.schedule_parameters['time_slot_num']
+        ids = self.ids
+        hours_layout = GridLayout(rows=time_slot_num, size_hint=(0.14, 1))
+        for time_slot in range(time_slot_num):
+            if f'Button_hours{time_slot}' not in ids:
+                button = Factory.ScheduleCellButton(text=f'{time_slot}')
                 button.background_color = [.8, .8, .9, .2]
-                # self.font_size: self.width / 8
-                button.bind(width=set_font_size(8))
-                # self.text_size: self.size
-                button.bind(size=set_text_size)
                 hours_layout.add_widget(button)
-                self.ids[f'Button_hours{time_slot}'] = button
-        self.ids.bottom_part.ids[f'hours_layout'] = hours_layout
-        self.ids.bottom_part.add_widget(hours_layout)
+                ids[f'Button_hours{time_slot}'] = button
+        ids.bottom_part.ids[f'hours_layout'] = hours_layout
+        ids.bottom_part.add_widget(hours_layout)
 
     def genrate_days_layout(self):
         days = ['Monday', 'Tusday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
         #                                                                              +1 is for displayed class button
-        days_layout = GridLayout(cols=ScheduleParameters.schedule_parameters['day_num']+1, size_hint=(0.86, 1))
-        for day in range(ScheduleParameters.schedule_parameters['day_num']):
-            if f'Button_days{day}' not in self.ids.keys():
-                button = Button(text=f'{days[day]}', halign='center', valign='center')
-                button.background_normal = ''
+        day_num = ScheduleParameters.schedule_parameters['day_num']
+        ids = self.ids
+        days_layout = GridLayout(cols=day_num+1, size_hint=(0.86, 1))
+        for day in range(day_num):
+            if f'Button_days{day}' not in ids:
+                button = Factory.ScheduleCellButton(text=f'{days[day]}')
                 if day % 2 == 0:
                     button.background_color = [.8, .8, .9, .2]
                 else:
                     button.background_color = [.8, .8, .9, .3]
-                # self.font_size: self.width / 8
-                button.bind(width=set_font_size(8))
-                # self.text_size: self.size
-                button.bind(size=set_text_size)
                 days_layout.add_widget(button)
-                self.ids[f'Button_days{day}'] = button
-        self.ids.top_bar.ids[f'days_layout'] = days_layout
-        self.ids.top_bar.add_widget(days_layout)
+                ids[f'Button_days{day}'] = button
+        ids.top_bar.ids[f'days_layout'] = days_layout
+        ids.top_bar.add_widget(days_layout)
 
     # Error Popup
     my_error_popup = Popup(title="Error", size_hint=(None, None), size=(300, 200), auto_dismiss=False)
@@ -382,30 +485,20 @@ class SeeSchedule(Screen):
 
     def update_schedule_description(self):
         try:
-            global schedule_global
-            # reshape and transpose schedule for convenient indexing
-            temp_schedule = schedule_global.schedule[SeeSchedule.classroom_displayed].T.reshape(-1, 1, 1).squeeze()
-            for time_slot in range(ScheduleParameters.schedule_parameters['day_num']
-                               * ScheduleParameters.schedule_parameters['time_slot_num']):
-                lesson = temp_schedule[time_slot]
-                if lesson != None:
-                    # Read lesson_type and convert it to user friendly string
-                    new_text = f'{lesson.lesson_type}'.split('.')[1].split('_')
-                    converted_text = str()
-                    for i in range(len(new_text)):
-                        converted_text += new_text[i] + ' '
-                    converted_text += f" [{lesson.instructor.id}]"
-                    # make button kind of a parent for lesson
-                    self.ids[f'Button{time_slot}'].ids['lesson'] = lesson
-                    self.ids[f'Button{time_slot}'].ids['lesson_time_slot'] = \
-                        time_slot
-                    self.ids[f'Button{time_slot}'].text = converted_text
+            # schedule of displayed classroom flattened for convenient indexing
+            schedule = App.get_running_app().schedule
+            temp_schedule = schedule.classroom_views[SeeSchedule.classroom_displayed]
+            for time_slot, (button, lesson_id) in enumerate(zip(self._button_refs, temp_schedule)):
+                # schedule stores ids of lessons, -1 is a free time slot
+                lesson = schedule.lessons[lesson_id] if lesson_id >= 0 else None
+                # make button kind of a parent for lesson
+                button.ids['lesson'] = lesson
+                button.ids['lesson_time_slot'] = time_slot
+                if lesson is not None:
+                    button.text = f"{lesson_type_texts[lesson.lesson_type]} [{lesson.instructor_id}]"
                 else:
-                    self.ids[f'Button{time_slot}'].ids['lesson'] = lesson
-                    self.ids[f'Button{time_slot}'].ids['lesson_time_slot'] = \
-                        time_slot
-                    self.ids[f'Button{time_slot}'].text = 'Free'
-        except AttributeError:
+                    button.text = 'Free'
+        except (AttributeError, IndexError):
             SeeSchedule.my_error_popup.open()
 
     def change_displayed_class_button_on_press(self, instance):
@@ -416,16 +509,18 @@ class SeeSchedule(Screen):
 
     # Pick Classroom Popup
     def pick_classroom_popup(self):
+        # popup is created again only when the number of classrooms has changed
+        class_num = ScheduleParameters.schedule_parameters['class_num']
+        if self._classroom_popup is not None and self._classroom_popup_class_num == class_num:
+            return self._classroom_popup.open()
+
         pick_classroom_popup = Popup(title="Pick Classroom", size_hint=(0.6, 0.6), auto_dismiss=False)
         pick_classroom_popup_main_layout = GridLayout(cols=1, size_hint=(1, 1))
         pick_classroom_popup_classroom_buttons = GridLayout(cols=3, size_hint=(1, 0.8))
-        for classroom in range(ScheduleParameters.schedule_parameters['class_num']):
-            button = ToggleButton(group='classroom_displayed', text=f'Classroom:{classroom}', halign='center', valign='center')
+        for classroom in range(class_num):
+            # font and text sizes are set by the rule in new_window.kv
+            button = Factory.ClassroomToggleButton(group='classroom_displayed', text=f'Classroom:{classroom}')
             button.ids['classroom_id'] = classroom
-            # self.font_size: self.width / 8
-            button.bind(width=set_font_size(12))
-            # self.text_size: self.size
-            button.bind(size=set_text_size)
             button.bind(on_press=self.change_displayed_class_button_on_press)
             pick_classroom_popup_classroom_buttons.add_widget(button)
 
@@ -434,26 +529,102 @@ class SeeSchedule(Screen):
                                                        on_press=pick_classroom_popup.dismiss))
 
         pick_classroom_popup.content = pick_classroom_popup_main_layout
+        self._classroom_popup = pick_classroom_popup
+        self._classroom_popup_class_num = class_num
         pick_classroom_popup.open()
 
 
 class GoalFunction(Screen):
     box = None
 
-    def draw_plot(self):
+    def __init__(self, **kw):
+        super().__init__(**kw)
+        # elements of the plot are created once and reused by following draws
+        self._figure = None
+        self._axes = None
+        self._line = None
+        self._figure_canvas = None
+        self._texture = None
+        self._rectangle = None
+        self._background = None
+        self._plot_limits = None
+
+    def create_plot(self):
+        # figure is created without pyplot, so it is not kept in the global pyplot registry
+        self._figure = Figure()
+        self._axes = self._figure.add_subplot(111)
+        self._axes.set_title('Goal function over number of iterations')
+        self._axes.set_xlabel('Number of iterations')
+        self._axes.set_ylabel('Earnings [$]')
+        # animated line is excluded from drawing the static part of the plot
+        self._line, = self._axes.plot([], [], animated=True)
+        # figure is rendered off-screen and its pixels are shown as a texture of the box canvas
+        self._figure_canvas = FigureCanvasAgg(self._figure)
         box = self.ids.box
-        box.clear_widgets()
-        plt.clf()
-        plt.plot(Optimize.all_costs)
-        plt.title('Goal function over number of iterations')
-        plt.xlabel('Number of iterations')
-        plt.ylabel('Earnings [$]')
-        box.add_widget(FigureCanvasKivyAgg(plt.gcf()))
+        with box.canvas:
+            Color(1, 1, 1, 1)
+            self._rectangle = Rectangle(pos=box.pos, size=box.size)
+        self._resize_figure(box.size)
+        # resizing redraws the figure, so also the background has to be captured again
+        box.bind(size=self.on_box_size, pos=self.on_box_pos)
+
+    def _resize_figure(self, size):
+        width, height = max(int(size[0]), 1), max(int(size[1]), 1)
+        dpi = self._figure.get_dpi()
+        self._figure.set_size_inches(width / dpi, height / dpi)
+        # Agg rows go from top to bottom, Kivy textures from bottom to top
+        self._texture = Texture.create(size=(width, height), colorfmt='rgba')
+        self._texture.flip_vertical()
+        self._rectangle.texture = self._texture
+        self._background = None
+
+    def on_box_size(self, instance, value):
+        self._rectangle.size = value
+        self._resize_figure(value)
+        self.draw_plot()
+
+    def on_box_pos(self, instance, value):
+        self._rectangle.pos = value
+
+    def draw_plot(self):
+        if self._figure_canvas is None:
+            self.create_plot()
+
+        costs = self.manager.get_screen('optimize').all_costs
+        x, y = downsample_costs(costs)
+        self._line.set_data(x, y)
+        if len(costs) > 0:
+            plot_limits = (0, max(len(costs) - 1, 1), np.min(y), np.max(y))
+        else:
+            plot_limits = (0, 1, 0, 1)
+
+        # static part of the plot is rendered again only when axis limits change
+        if self._background is None or plot_limits != self._plot_limits:
+            self._plot_limits = plot_limits
+            x_min, x_max, y_min, y_max = plot_limits
+            if y_min == y_max:
+                y_min, y_max = y_min - 1, y_max + 1
+            self._axes.set_xlim(x_min, x_max)
+            self._axes.set_ylim(y_min, y_max)
+            self._figure_canvas.draw()
+            self._background = self._figure_canvas.copy_from_bbox(self._figure.bbox)
+        else:
+            self._figure_canvas.restore_region(self._background)
+
+        # draw only the line on top of the background and copy the pixels to the texture
+        self._axes.draw_artist(self._line)
+        buf = np.asarray(self._figure_canvas.buffer_rgba())
+        if tuple(self._texture.size) != (buf.shape[1], buf.shape[0]):
+            # figure size in pixels may be rounded differently than the box size
+            self._texture = Texture.create(size=(buf.shape[1], buf.shape[0]), colorfmt='rgba')
+            self._texture.flip_vertical()
+            self._rectangle.texture = self._texture
+        self._texture.blit_buffer(buf.tobytes(), colorfmt='rgba', bufferfmt='ubyte')
+        self.ids.box.canvas.ask_update()
 
     def reset_solution(self):
         global initial_solution
-        global schedule_global
-        schedule_global = copy.deepcopy(initial_solution)
+        App.get_running_app().schedule = copy.deepcopy(initial_solution)
         if initial_solution is not None:
             ScheduleParameters.schedule_parameters = {'class_num': initial_solution.class_num,
                                                       'day_num': initial_solution.day_num,
@@ -471,11 +642,14 @@ class SeeAlgorithmParameters(Screen):
 class WindowManager(ScreenManager):
     pass
 
-kv = Builder.load_file('new_window.kv')
 
 class ScheduleOrganizer(App):
+    # currently displayed and optimized schedule, widgets bind to it to refresh
+    schedule = ObjectProperty(None, allownone=True)
+
     def build(self):
-        return kv
+        # kv file is loaded when the app is running, so screens can bind to its properties
+        return Builder.load_file('new_window.kv')
 
 if __name__ == '__main__':
     ScheduleOrganizer().run()
@@ -1,12 +1,42 @@
 import numpy as np
-import pandas as pd
+import csv
+import multiprocessing
+import os
 from typing import List
 from enum import Enum
-import copy
 import random
 import time
+import math
 import matplotlib.pyplot as plt
 
+# numba is an optional dependency - without it simulated annealing runs in pure Python
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        # decorator used instead of numba.njit, returns function unchanged
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda function: function
+
+# neighborhood types which only move lessons between time slots, supported by _sa_kernel
+KERNEL_NEIGHBORHOOD_TYPES = {'move_one': 1, 'move_two': 2}
+
+# cooling schedules - exponential, linear and logarithmic multiplicative cooling
+COOLING_SCHEDULES = {'ExpMult': 0, 'LinMult': 1, 'LogMult': 2}
+
+# type of the cells of the schedule - ids of lessons, -1 for a free time slot
+LESSON_ID_DTYPE = np.int16
+
+# number of temperature levels processed by one call of _sa_kernel
+KERNEL_TEMP_STEPS = 100
+
+# maximal number of costs preallocated up front by simulated_annealing, array grows when exceeded
+MAX_PREALLOCATED_COSTS = 10 ** 6
+
 
 class LessonType(Enum):
     """
@@ -37,6 +67,8 @@ class Client:
         a number which represents the client 
     selected_training: List[LessonType], default=None
         list of the trainings selected by a client
+    training_mask: int
+        bitmask of the selected trainings, bit lesson_type.value is set for every selected lesson type
 
     Methods
     -------
@@ -52,6 +84,9 @@ class Client:
             self.selected_training = np.array(list())
         else:
             self.selected_training = np.array(selected_training)
+        self.training_mask = 0
+        for lesson_type in self.selected_training:
+            self.training_mask |= 1 << lesson_type.value
 
     def __str__(self) -> str:
         """
@@ -77,6 +112,8 @@ class Instructor:
         a number which represents the instructor 
     qualifications: List[LessonType], default=None
         list of the trainings which can be tought by the instructor
+    training_mask: int
+        bitmask of the qualifications, bit lesson_type.value is set for every lesson type
 
     Methods
     -------
@@ -92,6 +129,9 @@ class Instructor:
             self.qualifications = np.array(list())
         else:
             self.qualifications = np.array(qualifications)
+        self.training_mask = 0
+        for lesson_type in self.qualifications:
+            self.training_mask |= 1 << lesson_type.value
 
     def __str__(self) -> str:
         """
@@ -105,11 +145,7 @@ class Instructor:
         """
         qualification_str = str()
         for elem in self.qualifications:
-            temp = str(elem).split('.')[1].split('_')
-            converted_text = str()
-            for i in range(len(temp)):
-                converted_text += temp[i] + ' '
-            qualification_str += converted_text + '\n'
+            qualification_str += ' '.join(elem.name.split('_')) + ' \n'
         return f"id: {self.id}, qualifications: {qualification_str}"
 
 
@@ -122,10 +158,16 @@ class Lesson:
     ---------
     instructor : Instructor
         an instructor which conducts classes
+    instructor_id : int
+        id of the instructor, -1 if there is no instructor
     lesson_type: LessonType
         type of the conducted classes
     participiants: List[Client], default=None
         a list of clients which take part in the classes
+    participant_ids: np.ndarray
+        ids of the participants
+    n_participants: int
+        number of the participants
 
     Methods
     -------
@@ -135,6 +177,7 @@ class Lesson:
 
     def __init__(self, instructor: Instructor, lesson_type: LessonType, participants: List[Client] = None):
         self.instructor = instructor
+        self.instructor_id = instructor.id if instructor is not None else -1
         self.lesson_type = lesson_type
 
         # checks if participants list was given, if not, creates empty array
@@ -142,6 +185,8 @@ class Lesson:
             self.participants = np.array(list())
         else:
             self.participants = np.array(participants)
+        self.participant_ids = np.array([participant.id for participant in self.participants], dtype=np.int64)
+        self.n_participants = self.participants.shape[0]
 
     def __str__(self):
         """
@@ -154,11 +199,8 @@ class Lesson:
             string to be printed
         """
 
-        # changes "LessonType.Type" representation to "Type" and prints it with instructor id
-        lesson_type = str(self.lesson_type)
-        lt = lesson_type.split(sep='.')
-        lesson_type = lt[1]
-        return f"I: {self.instructor.id}, L: {lesson_type}"
+        # prints name of the lesson type ("Type" instead of "LessonType.Type") with instructor id
+        return f"I: {self.instructor_id}, L: {self.lesson_type.name}"
 
 
 class Schedule:
@@ -206,6 +248,10 @@ class Schedule:
         Simulated Annealing algorithm which optimizes arranging of a schedule
     improve_results()
         Minimizes days of presence for each instructor
+    get_lesson_id(lesson)
+        Returns index of the lesson in the table of lessons
+    update_classroom_views()
+        Stores schedule of every classroom flattened time slot by time slot
     __str__()
         Helps to print a current schedule preety and intuitive
     """
@@ -221,22 +267,40 @@ class Schedule:
         self.max_clients_per_training = max_clients_per_training
 
         self.clients = list()
-        df = pd.read_csv(client_file, sep=";")
-        for index, client in df.iterrows():
-            self.clients.append(Client(client['Client_ID'],
-                                       [LessonType(int(elem)) for elem in client['Lesson_Types'].split(sep=" ")]))
+        # files are saved with BOM, it is removed by utf-8-sig encoding
+        with open(client_file, newline='', encoding='utf-8-sig') as file:
+            for client in csv.DictReader(file, delimiter=';'):
+                self.clients.append(Client(int(client['Client_ID']),
+                                           [LessonType(int(elem)) for elem in client['Lesson_Types'].split()]))
         self.clients = np.array(self.clients)
 
         self.instructors = list()
-        df = pd.read_csv(instructor_file, sep=";")
-        for index, instructor in df.iterrows():
-            self.instructors.append(Instructor(instructor['Instructor_ID'],
-                                               [LessonType(int(elem)) for elem in
-                                                instructor['Lesson_Types'].split(sep=" ")]))
+        with open(instructor_file, newline='', encoding='utf-8-sig') as file:
+            for instructor in csv.DictReader(file, delimiter=';'):
+                self.instructors.append(Instructor(int(instructor['Instructor_ID']),
+                                                   [LessonType(int(elem)) for elem in
+                                                    instructor['Lesson_Types'].split()]))
         self.instructors = np.array(self.instructors)  # lista na początku żeby móc appendować na essie
-        self.schedule = np.array([None for x in
-                                  range(self.class_num * self.day_num * self.time_slot_num)])
-        self.schedule = self.schedule.reshape((self.class_num, self.day_num, self.time_slot_num))
+
+        # selected trainings of clients and qualifications of instructors - rows are indexed
+        # like self.clients and self.instructors, columns by values of LessonType
+        lesson_type_values = np.arange(len(LessonType))
+        client_masks = np.array([client.training_mask for client in self.clients], dtype=np.int64)
+        self.client_wants = (client_masks[:, None] >> lesson_type_values & 1).astype(bool)
+        instructor_masks = np.array([instructor.training_mask for instructor in self.instructors], dtype=np.int64)
+        self.instructor_can_teach = (instructor_masks[:, None] >> lesson_type_values & 1).astype(bool)
+
+        # schedule stores ids of lessons (indices in self.lessons), -1 represents a free time slot
+        self.lessons = list()
+        self.schedule = np.full((self.class_num, self.day_num, self.time_slot_num), -1, dtype=LESSON_ID_DTYPE)
+        # ids of lessons by (lesson type, participants' ids, instructor's id), see get_lesson_id
+        self._lesson_ids = dict()
+        # arrays describing lessons, indexed by lesson ids, see _get_lesson_tables
+        self._lesson_tables = None
+        # solution which counters of lessons are kept, see _init_cost_state
+        self._tracked_solution = None
+        # flattened schedules of classrooms, computed by update_classroom_views
+        self.classroom_views = list()
 
         # economy
         self.ticket_cost = ticket_cost
@@ -258,25 +322,34 @@ class Schedule:
         ----------
         greedy: bool, default=False
             Decides about the method of generating random schedule. It greedy=True
-            then all classes are stored time slot by time slot in our schedule (all
-            classes are held in the row). If greedy=False classes are initialized
-            totally randomly.
+            then lessons of every instructor are packed into as few days and classes
+            as possible, see _generate_packed_schedule. If greedy=False classes are
+            initialized totally randomly.
         """
 
-        # reshaping to a vector [1 x classes * days * time slots] to facilitate iterating 
-        self.schedule = self.schedule.reshape((-1, 1, 1)).squeeze()
-        i = 0
+        # clearing previous schedule
+        self.lessons = list()
+        self._lesson_ids = dict()
+        self._lesson_tables = None
+        self.schedule = np.full((self.class_num, self.day_num, self.time_slot_num), -1, dtype=LESSON_ID_DTYPE)
+
+        if greedy:
+            self._generate_packed_schedule()
+            return
+
+        # flat view [classes * days * time slots] of self.schedule to facilitate iterating
+        flat_schedule = self.schedule.reshape(-1)
 
         # list of free time slots in particular days 
-        free_ts = list(np.arange(self.schedule.shape[0]))
+        free_ts = list(range(flat_schedule.shape[0]))
 
         # iterating over lesson types
         for lesson_type in LessonType:
 
             # list of all participants and instructor who have chosen particular lesson type
-            all_participants = [client for client in self.clients if lesson_type in client.selected_training]
-            all_instructors = {instructor.id: instructor for instructor in self.instructors if
-                               lesson_type in instructor.qualifications}
+            all_participants = list(self.clients[np.flatnonzero(self.client_wants[:, lesson_type.value])])
+            all_instructors = {instructor.id: instructor for instructor in
+                               self.instructors[np.flatnonzero(self.instructor_can_teach[:, lesson_type.value])]}
 
             # number of trainings which need to be coducted to please all clients
             num_of_trainings = int(np.ceil(len(all_participants) / self.max_clients_per_training))
@@ -288,35 +361,79 @@ class Schedule:
                 participants = all_participants[training * self.max_clients_per_training:
                                                 training * self.max_clients_per_training + self.max_clients_per_training]
 
-                # choosing a way to allocate lessons in schedule
-                if greedy:
-                    lesson_id = i
-                    i += 1
-                else:
-                    lesson_id = free_ts.pop(random.randint(0, len(free_ts) - 1))
-                    # TODO obsłużyć zbyt dużą liczbę zajęć - np. poprzez dodanie nowej sali
+                # drawn time slot is replaced by the last one, so it is removed in O(1)
+                k = random.randrange(len(free_ts))
+                slot_id = free_ts[k]
+                free_ts[k] = free_ts[-1]
+                free_ts.pop()
+                # TODO obsłużyć zbyt dużą liczbę zajęć - np. poprzez dodanie nowej sali
 
-                # interval in vector self.schedule which represents a break between same time slots
+                # interval in flat_schedule which represents a break between same time slots
                 # and days in different classes
                 interval = self.day_num * self.time_slot_num
 
                 # iterating over same days and time slots in different classes
-                for ts in range(lesson_id % interval, self.schedule.shape[0], interval):
+                for ts in range(slot_id % interval, flat_schedule.shape[0], interval):
 
                     # checking if lesson is taking place 
-                    if self.schedule[ts] != None:
-                        if self.schedule[ts].instructor.id in all_instructors.keys():
-                            # removing inaccessible instructors from all_instructors list
-                            all_instructors.pop(self.schedule[ts].instructor.id)  # TODO: TEST
+                    if flat_schedule[ts] >= 0:
+                        # removing inaccessible instructors from all_instructors, keyed by instructors' ids
+                        all_instructors.pop(self.lessons[flat_schedule[ts]].instructor_id, None)
 
                 # random choice of instructor from all_instructors list for new lesson
                 instructor = random.choice(list(all_instructors.values()))
 
                 # putting new lesson to schedule
-                self.schedule[lesson_id] = Lesson(instructor, lesson_type, participants)
+                flat_schedule[slot_id] = self.get_lesson_id(Lesson(instructor, lesson_type, participants))
+
+    def _generate_packed_schedule(self):
+        """
+        Fills empty self.schedule packing lessons of every instructor into as few days as possible.
 
-        # reshaping self.schedule back to matrix
-        self.schedule = self.schedule.reshape((self.class_num, self.day_num, self.time_slot_num))
+        Clients are divided into lessons like in the random schedule. Lessons are assigned greedily
+        to the instructor qualified to conduct the most of unassigned lessons, the costs of the presence
+        of instructors are paid for fewer instructors this way. Then lessons of every instructor are placed
+        first-fit in a free time slot, preferring days when the instructor already teaches
+        and classrooms already used in that day.
+        """
+        # lessons to conduct as (lesson type, participants)
+        lessons = list()
+        for lesson_type in LessonType:
+            participants = list(self.clients[np.flatnonzero(self.client_wants[:, lesson_type.value])])
+            for start in range(0, len(participants), self.max_clients_per_training):
+                lessons.append((lesson_type, participants[start:start + self.max_clients_per_training]))
+
+        # assigning lessons to instructors, instructor can conduct one lesson in every time slot
+        capacity = self.day_num * self.time_slot_num
+        unassigned = list(range(len(lessons)))
+        candidates = list(self.instructors)
+        assignment = list()
+        while unassigned:
+            counts = [sum(instructor.training_mask >> lessons[lesson][0].value & 1 for lesson in unassigned)
+                      for instructor in candidates]
+            if len(candidates) == 0 or max(counts) == 0:
+                raise ValueError(f"No instructor is available for {lessons[unassigned[0]][0].name} lessons")
+            instructor = candidates.pop(int(np.argmax(counts)))
+            taught = [lesson for lesson in unassigned
+                      if instructor.training_mask >> lessons[lesson][0].value & 1][:capacity]
+            unassigned = [lesson for lesson in unassigned if lesson not in taught]
+            assignment.append((instructor, taught))
+
+        for instructor, taught in assignment:
+            present = np.zeros(self.day_num, dtype=bool)
+            busy = np.zeros((self.day_num, self.time_slot_num), dtype=bool)
+            for lesson in taught:
+                class_used = (self.schedule >= 0).any(axis=2)
+                # free time slots ordered by preference
+                places = [(not present[d], not class_used[c, d], d, c, ts)
+                          for c, d, ts in np.argwhere(self.schedule < 0) if not busy[d, ts]]
+                if len(places) == 0:
+                    raise ValueError("Not enough time slots to schedule all lessons")
+                _, _, d, c, ts = min(places)
+                lesson_type, participants = lessons[lesson]
+                self.schedule[c, d, ts] = self.get_lesson_id(Lesson(instructor, lesson_type, participants))
+                present[d] = True
+                busy[d, ts] = True
 
     def get_cost(self, current_solution=None):
         """
@@ -327,7 +444,7 @@ class Schedule:
         ----------
         current_solution: np.array, default=None
             If current_solution is None method computes cost for self.schedule,
-            if given, method computes cost for given parameter.
+            if given, method computes cost for given parameter (array of lesson ids).
 
         Returns
         -------
@@ -338,39 +455,36 @@ class Schedule:
         if current_solution is None:
             current_solution = self.schedule
 
-        participants_sum = 0
-        instructors_hours = np.zeros(shape=(self.instructors.shape[0], self.day_num))
-        class_per_day = np.zeros(shape=(self.class_num, self.day_num))
-        repeated_instructors = 0
-        unmatched_instructors = 0
-
-        # for every lesson in solution count number of participants, instructors' hours and classrooms used
-
-        for d in range(current_solution.shape[1]):
-            for ts in range(current_solution.shape[2]):
-                used_instructors = list()
-                for c in range(current_solution.shape[0]):
-                    if current_solution[c, d, ts] is not None:
-                        if current_solution[c, d, ts].lesson_type not in \
-                                current_solution[c, d, ts].instructor.qualifications:
-                            unmatched_instructors += 1
-                        used_instructors.append(current_solution[c, d, ts].instructor.id)
-                        participants_sum += current_solution[c, d, ts].participants.shape[0]
-                        instructors_hours[current_solution[c, d, ts].instructor.id, d] += 1
-                        class_per_day[c, d] = 1
-                repeated_instructors += len(used_instructors) - len(set(used_instructors))
+        lesson_instructors, lesson_participants, lesson_unmatched = self._get_lesson_tables()
+        instructors_num = self.instructors.shape[0]
+
+        # class, day and time slot of every lesson in solution
+        occupied = current_solution >= 0
+        c, d, ts = np.nonzero(occupied)
+        lesson_ids = current_solution[c, d, ts]
+        instructors = lesson_instructors[lesson_ids]
+
+        participants_sum = lesson_participants[lesson_ids].sum()
+        hours_sum = lesson_ids.shape[0]
+        # number of lessons of every instructor in every day
+        instructors_hours = np.bincount(instructors * self.day_num + d, minlength=instructors_num * self.day_num)
+        class_per_day = occupied.any(axis=2)
 
         # count cost function
         cost = self.ticket_cost * participants_sum - \
-               self.hour_pay * instructors_hours.sum() - \
-               self.pay_for_presence * (instructors_hours > 0).sum() - \
-               self.class_renting_cost * class_per_day.sum()
+               self.hour_pay * hours_sum - \
+               self.pay_for_presence * np.count_nonzero(instructors_hours) - \
+               self.class_renting_cost * np.count_nonzero(class_per_day)
         if self.use_penalty_method:
+            unmatched_instructors = lesson_unmatched[lesson_ids].sum()
+            # every lesson of the instructor except the first one in the time slot is repeated
+            instructor_ts = (instructors * self.day_num + d) * self.time_slot_num + ts
+            repeated_instructors = hours_sum - np.unique(instructor_ts).shape[0]
             cost -= unmatched_instructors * self.penalty_for_unmatched + \
                     repeated_instructors * self.penalty_for_repeated
-        return cost
+        return float(cost)
 
-    def get_neighbor(self, current_solution, neighborhood_type_lst: List[str]):
+    def get_neighbor(self, current_solution, neighborhood_type_lst: List[str], changes=None):
         """
         A method which generates new solution which differ from previous one
         only by one classes.
@@ -381,54 +495,53 @@ class Schedule:
         Parameters
         ----------
         current_solution: np.array
-            Parameter which contains solution for which we want to find a neighbor.
+            Parameter which contains solution (array of lesson ids) for which we want to find a neighbor.
+            It is modified in place.
 
         neighborhood_type_lst: List[str]
             Parameter specify method of choosing neighborhood
 
+        changes: list, default=None
+            If given, every change of current_solution is appended to it as a tuple
+            (flat index, previous lesson id, new lesson id), see _apply_changes and _revert_changes.
+
         Returns
         -------
         np.array
             Generated neighbor.
         """
         # TODO uwzględnić ograniczenia
+        # time slots are drawn as indices of the flattened solution
+        flat_solution = current_solution.reshape(-1)
+        tracked = current_solution is self._tracked_solution
         for neighborhood_type in neighborhood_type_lst:
             if neighborhood_type == 'move_one' or neighborhood_type == 'move_two':
-                # reshaping current_solution to make sure it's a matrix
-                current_solution = current_solution.reshape((-1, 1, 1))
                 if neighborhood_type == 'move_one':
                     i_max = 1
                 else:
                     i_max = 2
                 for i in range(i_max):
-                    # get list of indices where lesson is scheduled
-                    # using != None is necessary, because we are interested in
-                    # checking if value in array is None, not if array is None
-                    not_none_id_list = np.argwhere(current_solution != None)
-                    # choose random index from not_none_id_list
-                    random_not_none_id = tuple(random.choice(not_none_id_list))
-
-                    # get list of indices where timeslot is free
-                    # using == None is necessary, because we are interested in
-                    # checking if value in array is None, not if array is None
-                    none_id_list = np.argwhere(current_solution == None)
-                    random_none_id = tuple(random.choice(none_id_list))
+                    if tracked:
+                        # draw from the lists of occupied and free time slots kept by _set_lesson
+                        random_not_none_id = random.choice(self._occupied_slots)
+                        random_none_id = random.choice(self._free_slots)
+                    else:
+                        # choose random index where lesson is scheduled and where timeslot is free
+                        random_not_none_id = int(random.choice(np.flatnonzero(flat_solution >= 0)))
+                        random_none_id = int(random.choice(np.flatnonzero(flat_solution < 0)))
 
                     # swap values contained in drawn indices
-                    current_solution[random_none_id] = current_solution[random_not_none_id]
-                    current_solution[random_not_none_id] = None
+                    self._set_lesson(current_solution, random_none_id, flat_solution[random_not_none_id], changes)
+                    self._set_lesson(current_solution, random_not_none_id, -1, changes)
 
             if neighborhood_type == 'move_to_most_busy' or neighborhood_type == 'swap_with_most_busy':
-                # reshaping current_solution to make sure it's a matrix
-                current_solution = current_solution.reshape((self.class_num, self.day_num, self.time_slot_num))
-
                 most_busy = None
                 most_trainings = 0
                 least_busy = None
                 least_trainings = self.time_slot_num
                 for c in range(self.schedule.shape[0]):
                     for d in range(self.schedule.shape[1]):
-                        trainings_num = np.count_nonzero(current_solution[c, d, :] != None)
+                        trainings_num = np.count_nonzero(current_solution[c, d, :] >= 0)
                         if neighborhood_type == 'move_to_most_busy':
                             condition = most_trainings <= trainings_num < self.time_slot_num
                         else:
@@ -442,45 +555,162 @@ class Schedule:
                             least_busy = (c, d)
 
                 c_least, d_least = least_busy
-                id_least = random.choice(np.argwhere(current_solution[c_least, d_least, :] != None))
+                id_least = random.choice(np.flatnonzero(current_solution[c_least, d_least, :] >= 0))
+                least_id = (c_least * self.day_num + d_least) * self.time_slot_num + int(id_least)
                 c_most, d_most = most_busy
                 if neighborhood_type == 'move_to_most_busy':
-                    id_most = random.choice(np.argwhere(current_solution[c_most, d_most, :] == None))
-                    current_solution[c_most, d_most, id_most] = current_solution[c_least, d_least, id_least]
-                    current_solution[c_least, d_least, id_least] = None
+                    id_most = random.choice(np.flatnonzero(current_solution[c_most, d_most, :] < 0))
+                    most_id = (c_most * self.day_num + d_most) * self.time_slot_num + int(id_most)
+                    self._set_lesson(current_solution, most_id, flat_solution[least_id], changes)
+                    self._set_lesson(current_solution, least_id, -1, changes)
                 elif neighborhood_type == 'swap_with_most_busy':
-                    id_most = random.choice(np.argwhere(current_solution[c_most, d_most, :] != None))
-                    current_solution[c_most, d_most, id_most], current_solution[c_least, d_least, id_least] \
-                        = current_solution[c_least, d_least, id_least], current_solution[c_most, d_most, id_most]
+                    id_most = random.choice(np.flatnonzero(current_solution[c_most, d_most, :] >= 0))
+                    most_id = (c_most * self.day_num + d_most) * self.time_slot_num + int(id_most)
+                    lesson_most = flat_solution[most_id]
+                    lesson_least = flat_solution[least_id]
+                    self._set_lesson(current_solution, most_id, lesson_least, changes)
+                    self._set_lesson(current_solution, least_id, lesson_most, changes)
 
             if neighborhood_type == 'change_instructor':
-                current_solution = current_solution.reshape((-1, 1, 1))
-
-                not_none_id_list = np.argwhere(current_solution != None)
-                random_not_none_id = tuple(random.choice(not_none_id_list))
+                if tracked:
+                    random_not_none_id = random.choice(self._occupied_slots)
+                else:
+                    random_not_none_id = int(random.choice(np.flatnonzero(flat_solution >= 0)))
 
-                type_of_selected_lesson = current_solution[random_not_none_id].lesson_type
+                selected_lesson = self.lessons[flat_solution[random_not_none_id]]
+                type_of_selected_lesson = selected_lesson.lesson_type
 
                 if self.use_penalty_method:
                     available_instructors = self.instructors
                 else:
                     available_instructors = [instructor for instructor in self.instructors
-                                             if type_of_selected_lesson in instructor.qualifications and
-                                             instructor.id != current_solution[random_not_none_id].instructor.id]
+                                             if instructor.training_mask >> type_of_selected_lesson.value & 1 and
+                                             instructor.id != selected_lesson.instructor_id]
 
                 if len(available_instructors) == 0:
-                    new_instructor = current_solution[random_not_none_id].instructor
+                    new_instructor = selected_lesson.instructor
                 else:
                     new_instructor = random.choice(available_instructors)
 
-                current_solution[random_not_none_id].instructor = new_instructor
+                # lessons are shared by all solutions, so lesson with new instructor is put instead of modifying it
+                self._set_lesson(current_solution, random_not_none_id, self.get_lesson_id(
+                    Lesson(new_instructor, selected_lesson.lesson_type, selected_lesson.participants)), changes)
 
-        current_solution = current_solution.reshape((self.class_num, self.day_num, self.time_slot_num))
         return current_solution
 
+    def _set_lesson(self, solution, flat_index, lesson_id, changes=None):
+        """
+        Puts lesson_id (-1 for a free time slot) in flat_index of flattened solution,
+        the change is appended to changes if they are given.
+
+        If solution is tracked by _init_cost_state, lists of occupied and free time slots are updated.
+        """
+        flat_solution = solution.reshape(-1)
+        previous_id = flat_solution[flat_index]
+        if changes is not None:
+            changes.append((flat_index, previous_id, lesson_id))
+        if solution is self._tracked_solution and (previous_id >= 0) != (lesson_id >= 0):
+            if lesson_id >= 0:
+                self._move_slot(flat_index, self._free_slots, self._occupied_slots)
+            else:
+                self._move_slot(flat_index, self._occupied_slots, self._free_slots)
+        flat_solution[flat_index] = lesson_id
+
+    def _move_slot(self, flat_index, source_slots, target_slots):
+        """
+        Moves time slot given by its flat index from source_slots to target_slots in O(1)
+        by replacing it with the last element of source_slots.
+        """
+        position = self._slot_positions[flat_index]
+        last = source_slots.pop()
+        if last != flat_index:
+            source_slots[position] = last
+            self._slot_positions[last] = position
+        self._slot_positions[flat_index] = len(target_slots)
+        target_slots.append(flat_index)
+
+    def _init_cost_state(self, solution):
+        """
+        Initializes counters of lessons used to compute changes of the cost of solution
+        without evaluating whole solution, see _apply_changes.
+
+        Counters store number of lessons of every instructor in every day, in every time slot
+        and number of lessons in every classroom in every day. Solution becomes tracked - lists
+        of its occupied and free time slots (flat indices) are kept by _set_lesson.
+        """
+        instructors_num = self.instructors.shape[0]
+        self._instructor_day_lessons = np.zeros((instructors_num, self.day_num), dtype=np.int32)
+        self._instructor_ts_lessons = np.zeros((instructors_num, self.day_num, self.time_slot_num), dtype=np.int32)
+        self._class_day_lessons = np.zeros((self.class_num, self.day_num), dtype=np.int32)
+
+        flat_solution = solution.reshape(-1)
+        self._occupied_slots = np.flatnonzero(flat_solution >= 0).tolist()
+        self._free_slots = np.flatnonzero(flat_solution < 0).tolist()
+        # position of every time slot in the list where it is stored
+        self._slot_positions = [0] * flat_solution.shape[0]
+        for slots in (self._occupied_slots, self._free_slots):
+            for position, flat_index in enumerate(slots):
+                self._slot_positions[flat_index] = position
+        self._tracked_solution = solution
+
+        for flat_index in self._occupied_slots:
+            self._count_lesson(flat_index, flat_solution[flat_index], 1)
+
+    def _count_lesson(self, flat_index, lesson_id, sign):
+        """
+        Adds (sign=1) or removes (sign=-1) lesson placed in flat_index of flattened solution
+        from the counters of lessons and returns the change of the cost.
+        """
+        c, d_ts = divmod(flat_index, self.day_num * self.time_slot_num)
+        d, ts = divmod(d_ts, self.time_slot_num)
+        lesson = self.lessons[lesson_id]
+        instructor_id = lesson.instructor_id
+
+        delta = sign * (self.ticket_cost * lesson.n_participants - self.hour_pay)
+        # presence of instructor and renting of classroom are paid for each day they are used
+        day_lessons = self._instructor_day_lessons[instructor_id, d]
+        delta -= self.pay_for_presence * (min(day_lessons + sign, 1) - min(day_lessons, 1))
+        class_lessons = self._class_day_lessons[c, d]
+        delta -= self.class_renting_cost * (min(class_lessons + sign, 1) - min(class_lessons, 1))
+        if self.use_penalty_method:
+            if not lesson.instructor.training_mask >> lesson.lesson_type.value & 1:
+                delta -= sign * self.penalty_for_unmatched
+            # every lesson of the instructor except the first one in the time slot is penalized
+            ts_lessons = self._instructor_ts_lessons[instructor_id, d, ts]
+            delta -= self.penalty_for_repeated * (max(ts_lessons + sign - 1, 0) - max(ts_lessons - 1, 0))
+
+        self._instructor_day_lessons[instructor_id, d] += sign
+        self._instructor_ts_lessons[instructor_id, d, ts] += sign
+        self._class_day_lessons[c, d] += sign
+        return delta
+
+    def _apply_changes(self, changes):
+        """
+        Updates the counters of lessons with changes made by get_neighbor and returns the change of the cost.
+        """
+        delta = 0
+        for flat_index, previous_id, new_id in changes:
+            if previous_id >= 0:
+                delta += self._count_lesson(flat_index, previous_id, -1)
+            if new_id >= 0:
+                delta += self._count_lesson(flat_index, new_id, 1)
+        return delta
+
+    def _revert_changes(self, solution, changes):
+        """
+        Reverts changes applied to solution and to the counters of lessons by _apply_changes.
+        """
+        for flat_index, previous_id, new_id in reversed(changes):
+            if new_id >= 0:
+                self._count_lesson(flat_index, new_id, -1)
+            if previous_id >= 0:
+                self._count_lesson(flat_index, previous_id, 1)
+            self._set_lesson(solution, flat_index, previous_id)
+
     def simulated_annealing(self, alpha=0.999, initial_temp=100, n_iter_one_temp=50, min_temp=0.1,
                             epsilon=0.01, n_iter_without_improvement=1000, initial_solution=True,
-                            neighborhood_type_lst=None, greedy=False):
+                            neighborhood_type_lst=None, greedy=False, cool_opt='ExpMult',
+                            progress_cb=None, should_stop=None):
         """
         Simulated Annealing is a probabilistic technique for approximating the global optimum
         of a given function.
@@ -509,6 +739,18 @@ class Schedule:
             Parameter specify method of choosing neighborhood
         greedy: bool, defalut=False
             Create initial solution packing trainings next to each other
+        cool_opt: str, default='ExpMult'
+            Cooling schedule, temperature after k decreases is equal to:
+            'ExpMult' - initial_temp * alpha ^ k,
+            'LinMult' - initial_temp / (1 + alpha * k),
+            'LogMult' - initial_temp / (1 + alpha * log(1 + k)).
+        progress_cb: callable, default=None
+            Function progress_cb(total_counter, current_temp, best_cost) called
+            after every decrease of the temperature, or after every KERNEL_TEMP_STEPS
+            decreases when the compiled kernel is used.
+        should_stop: callable, default=None
+            Function without arguments checked as often as progress_cb is called,
+            if it returns True algorithm is stopped and the best solution found so far is kept.
 
         Returns
         -------
@@ -516,191 +758,307 @@ class Schedule:
             Best earnings achieved while algorithm was running.
         total_counter: int
             Number of iterations processed when the algorithm was running.
+        all_costs: np.ndarray
+            Cost of the current solution after every iteration.
 
         """
         if neighborhood_type_lst is None:
             neighborhood_type_lst = ['move_one']
+        if cool_opt not in COOLING_SCHEDULES:
+            raise ValueError(f"Unknown cooling schedule: {cool_opt}")
+        cooling = COOLING_SCHEDULES[cool_opt]
 
         if not initial_solution:
             self.generate_random_schedule(greedy)  # self.schedule initialized
 
-        # copy existing schedule to prevent unwanted changes
-        current_solution = copy.deepcopy(self.schedule)
-        best_solution = copy.deepcopy(current_solution)
+        # compiled kernel is used when only lessons are moved between time slots
+        if NUMBA_AVAILABLE and \
+                all(neighborhood_type in KERNEL_NEIGHBORHOOD_TYPES for neighborhood_type in neighborhood_type_lst):
+            return self._simulated_annealing_kernel(alpha, initial_temp, n_iter_one_temp, min_temp, epsilon,
+                                                    n_iter_without_improvement, neighborhood_type_lst, cooling,
+                                                    progress_cb, should_stop)
 
-        current_temp = initial_temp
+        # copy existing schedule to prevent unwanted changes, lessons are shared since they are never modified
+        current_solution = self.schedule.copy()
+        best_solution = current_solution.copy()
 
-        # count current cost
+        # number of temperature decreases
+        temp_step = 0
+        current_temp = _get_temperature(cooling, initial_temp, alpha, temp_step)
+
+        # count current cost, following costs are updated by changes of the neighbors
         current_cost = self.get_cost(current_solution)
-        best_cost = self.get_cost(best_solution)
+        best_cost = current_cost
+        self._init_cost_state(current_solution)
 
         # counter for n_iter_without_improvement
         counter = 0
         # counter of total number of iterations
         total_counter = 0
 
-        # list containing all costs
-        all_costs = list()
+        # array containing all costs, preallocated for the number of iterations until min_temp is reached
+        temp_step_bound = _get_temp_step_bound(cooling, initial_temp, alpha, min_temp)
+        all_costs = np.empty(min(temp_step_bound * n_iter_one_temp, MAX_PREALLOCATED_COSTS) or 1, dtype=np.float64)
 
         # loop while non of stopping criteria is fulfilled
         while current_temp > min_temp and counter < n_iter_without_improvement:
+            # temperature is constant in the inner loop, so it is inverted once
+            inv_temp = 1.0 / current_temp
             for j in range(0, n_iter_one_temp):
                 total_counter += 1
-                neighbor_solution = self.get_neighbor(current_solution, neighborhood_type_lst)
-                neighbor_cost = self.get_cost(neighbor_solution)
-                # delta - value to evaluate quality of new solution
-                delta = neighbor_cost - current_cost
+                # neighbor is generated in place of current solution
+                changes = list()
+                self.get_neighbor(current_solution, neighborhood_type_lst, changes)
+                # delta - value to evaluate quality of new solution, costs of visited solutions
+                # are not memoized, since computing delta is cheaper than hashing the solution
+                delta = self._apply_changes(changes)
                 # if ne solution is better than current one - take it
                 if delta >= 0:
-                    current_solution = neighbor_solution
-                    current_cost = neighbor_cost
+                    current_cost += delta
                     if current_cost > best_cost:
-                        best_solution = copy.deepcopy(current_solution)
+                        best_solution[:] = current_solution
                         best_cost = current_cost
                 # else if s is small enough take it anyway
                 else:
-                    s = random.uniform(0, 1)
-                    if s < np.exp(delta / current_temp):
-                        current_solution = neighbor_solution
-                        current_cost = neighbor_cost
+                    s = random.random()
+                    if s < math.exp(delta * inv_temp):
+                        current_cost += delta
+                    else:
+                        self._revert_changes(current_solution, changes)
 
-                all_costs.append(current_cost)
+                if total_counter > len(all_costs):
+                    all_costs = np.concatenate((all_costs, np.empty_like(all_costs)))
+                all_costs[total_counter - 1] = current_cost
             # decrease temperature
-            current_temp = alpha * current_temp
+            temp_step += 1
+            current_temp = _get_temperature(cooling, initial_temp, alpha, temp_step)
             # check if new solution gives different cost - 2nd stopping criteria
             if (abs(current_cost - best_cost)) < epsilon:
                 counter += 1
             else:
                 counter = 0
 
+            if progress_cb is not None:
+                progress_cb(total_counter, current_temp, best_cost)
+            if should_stop is not None and should_stop():
+                break
+
+        self._tracked_solution = None
         self.schedule = best_solution
-        return best_cost, total_counter, all_costs
+        return best_cost, total_counter, all_costs[:total_counter]
+
+    def _simulated_annealing_kernel(self, alpha, initial_temp, n_iter_one_temp, min_temp, epsilon,
+                                    n_iter_without_improvement, neighborhood_type_lst, cooling,
+                                    progress_cb, should_stop):
+        """
+        Simulated Annealing executed by the compiled _sa_kernel.
+
+        Kernel processes KERNEL_TEMP_STEPS temperature levels at once,
+        callbacks are called between its calls.
+
+        ...
+        Parameters
+        ----------
+        Same as in simulated_annealing method, cooling is a value from COOLING_SCHEDULES.
+
+        Returns
+        -------
+        Same as in simulated_annealing method.
+        """
+        current_solution = np.ascontiguousarray(self.schedule, dtype=LESSON_ID_DTYPE).copy()
+        best_solution = current_solution.copy()
+
+        lesson_instructors, lesson_participants, lesson_unmatched = self._get_lesson_tables()
+        # arguments of _cost_kernel describing lessons and economy of the schedule
+        cost_args = (lesson_instructors, lesson_participants, lesson_unmatched, self.instructors.shape[0],
+                     self.ticket_cost, self.hour_pay, self.pay_for_presence, self.class_renting_cost,
+                     self.use_penalty_method, self.penalty_for_repeated, self.penalty_for_unmatched)
+
+        # number of moves in one neighbor generation
+        move_num = sum(KERNEL_NEIGHBORHOOD_TYPES[neighborhood_type] for neighborhood_type in neighborhood_type_lst)
+
+        current_cost = _cost_kernel(current_solution, *cost_args)
+        best_cost = current_cost
+        temp_step = 0
+        counter = 0
+        total_counter = 0
+        # costs are stored in one buffer for every call of the kernel
+        costs_buffer = np.empty(KERNEL_TEMP_STEPS * n_iter_one_temp, dtype=np.float64)
+        all_costs = list()
+        # random generator of the kernel is seeded only on the first call
+        seed = random.randrange(2 ** 31)
+
+        finished = False
+        while not finished:
+            temp_step, counter, current_cost, best_cost, iter_num, finished = _sa_kernel(
+                current_solution, best_solution, *cost_args,
+                cooling, alpha, initial_temp, n_iter_one_temp, min_temp, epsilon, n_iter_without_improvement,
+                move_num, temp_step, counter, current_cost, best_cost, KERNEL_TEMP_STEPS, costs_buffer, seed)
+            seed = -1
+            total_counter += iter_num
+            all_costs.append(costs_buffer[:iter_num].copy())
+
+            if progress_cb is not None:
+                progress_cb(total_counter, _get_temperature(cooling, initial_temp, alpha, temp_step), best_cost)
+            if should_stop is not None and should_stop():
+                break
+
+        self.schedule = best_solution
+        return best_cost, total_counter, np.concatenate(all_costs)
 
     def improve_results(self):
         # TODO: dodać wyświtlanie przed i po w GUUI
         """
         Minimizes days of presence for each instructor.
         
-        Method which looks for days when instructor teaches only one class and tries
-        to move this lesson to a day when instructor provides more classes. 
+        Method which looks for days when instructor teaches few classes and tries to move
+        these lessons to the days when instructor provides more classes.
+        Lessons are moved only when it increases earnings.
         
         ...
         Parameters
         ----------
 
         """
-        # loop repeating until there is no change to ensure
+        if len(self.lessons) == 0:
+            return
+        lesson_instructors = self._get_lesson_tables()[0]
+        # moves are evaluated by changes of the counters of lessons
+        self._init_cost_state(self.schedule)
+
+        # id of the instructor teaching in every time slot, -1 for a free time slot
+        instructors_grid = np.where(self.schedule >= 0, lesson_instructors[self.schedule], -1)
+        # classes and days of every instructor, only the bitmask of the moved instructor changes
+        class_day_bits = [self._class_day_bits(instructors_grid, instructor.id) for instructor in self.instructors]
+
+        # loop repeating until bitmasks stop changing to ensure
         # that instructor 1 can be moved in space freed by instructor 3
-        changed = True
         iter = 0
-        while changed and iter < 1000:
+        while iter < 1000:
             iter += 1
-            changed = False
+            previous_bits = list(class_day_bits)
 
-            # loop for each instructor
-            for instructor in self.instructors:
+            for i, instructor in enumerate(self.instructors):
+                # instructor teaching in one class in one day is already packed
+                if bin(class_day_bits[i]).count('1') <= 1:
+                    continue
+                if self._repack_lessons(instructors_grid, instructor.id):
+                    instructors_grid = np.where(self.schedule >= 0, lesson_instructors[self.schedule], -1)
+                    class_day_bits[i] = self._class_day_bits(instructors_grid, instructor.id)
 
-                # pick all trainings taught by instructor
-                # in format
-                # [day, list of timeslots of lessons taught by instructor, list of timeslots free in that day, class]
-                trainings = list()
-                for c in range(self.schedule.shape[0]):
-                    for d in range(self.schedule.shape[1]):
-                        timeslots = list()
-                        free_ts = list()
-                        for ts in range(self.schedule.shape[2]):
-                            if self.schedule[c, d, ts] != None:
-                                if self.schedule[c, d, ts].instructor.id == instructor.id:
-                                    timeslots.append(ts)
-                            else:
-                                free_ts.append(ts)
-                        if len(timeslots) > 0:
-                            trainings.append([d, timeslots, free_ts, c])
-
-                # sorting trainings by number of lessons taught by instructor in that day
-                trainings = [v for v in sorted(trainings, key=lambda item: len(item[1]))]
-
-                # for each day check if trainings can be reassigned
-                # to some day with more trainings thought by that instructor
-                for i in range(len(trainings) - 1):
-                    for j in range(i + 1, len(trainings)):
-                        timeslots_taken = list()
-                        changed = False
-                        REASSIGNMENT_INVALID_FLAG = False
-                        # check if lessons from trainings[i] can be reassigned
-                        # to the day represented by trainings[j]
-                        if len(trainings[i][1]) <= len(trainings[j][2]):
-                            for ts_iter in range(len(trainings[i][1])):
-                                for c in range(self.schedule.shape[0]):
-                                    if self.schedule[c, trainings[j][0], trainings[j][2][ts_iter]] is not None:
-                                        if self.schedule[c, trainings[j][0], trainings[j][2][ts_iter]].instructor.id \
-                                                == instructor.id:
-                                            REASSIGNMENT_INVALID_FLAG = True
-                                if REASSIGNMENT_INVALID_FLAG:
-                                    break
-                                # reassign
-                                self.schedule[trainings[j][3], trainings[j][0], trainings[j][2][ts_iter]] = \
-                                    self.schedule[trainings[i][3], trainings[i][0], trainings[i][1][ts_iter]]
-
-                                self.schedule[trainings[i][3], trainings[i][0], trainings[i][1][ts_iter]] = None
-                                # add to taken sluts in j
-                                trainings[j][1].append(trainings[j][2][ts_iter])
-                                # add to free slots in i
-                                trainings[i][2].append(trainings[i][1][ts_iter])
-                                # memorize to delete from free in j
-                                timeslots_taken.append(trainings[j][2][ts_iter])
-
-                                # mark that changes have been made
-                                changed = True
-
-                            if not REASSIGNMENT_INVALID_FLAG:
-                                # delete memorized slots from free in j
-                                for ts_iter in timeslots_taken:
-                                    trainings[j][2].remove(ts_iter)
-                                # clear list of taken slots in i
-                                trainings[i][1] = []
-
-                        # if previous statement is untrue check if opposite reassignment can be performed,
-                        # i. e. check if lessons from trainings[j] can be reassigned
-                        # to the day represented by trainings[i]
-                        elif len(trainings[i][2]) > len(trainings[j][1]):
-                            for ts_iter in range(len(trainings[j][1])):
-                                for c in range(self.schedule.shape[0]):
-                                    if self.schedule[c, trainings[i][0], trainings[i][2][ts_iter]] is not None:
-                                        if self.schedule[c, trainings[i][0], trainings[i][2][ts_iter]].instructor.id \
-                                                    == instructor.id:
-                                            REASSIGNMENT_INVALID_FLAG = True
-                                if REASSIGNMENT_INVALID_FLAG:
-                                    break
-                                self.schedule[trainings[i][3], trainings[i][0], trainings[i][2][ts_iter]] = \
-                                    self.schedule[trainings[j][3], trainings[j][0], trainings[j][1][ts_iter]]
-
-                                self.schedule[trainings[j][3], trainings[j][0], trainings[j][1][ts_iter]] = None
-                                # add to taken slots in i
-                                trainings[i][1].append(trainings[i][2][ts_iter])
-                                # add to free sluts in j
-                                trainings[j][2].append(trainings[j][1][ts_iter])
-                                # memorize to delete from free in i
-                                timeslots_taken.append(trainings[i][2][ts_iter])
-
-                                # mark that changes have been made
-                                changed = True
-
-                            if not REASSIGNMENT_INVALID_FLAG:
-                                # delete memorized slots from free in i
-                                for ts_iter in timeslots_taken:
-                                    trainings[i][2].remove(ts_iter)
-                                    # clear list of taken slots in i
-                                trainings[j][1] = []
-
-                        # if changes have been made
-                        if changed:
-                            # sort trainings to keep ascending order of
-                            # number of lessons thought by instructor in that day
-                            trainings = [v for v in sorted(trainings, key=lambda item: len(item[1]))]
-                            # go to next iteration of i - next iterations for that i are unnecessary,
-                            # because trainings[i] have been reassigned
-                            break
+            if class_day_bits == previous_bits:
+                break
+        self._tracked_solution = None
+
+    def _class_day_bits(self, instructors_grid, instructor_id):
+        """
+        Returns bitmask of classes and days when the instructor teaches,
+        bit c * day_num + d is set if the instructor teaches in class c in day d.
+        """
+        used = (instructors_grid == instructor_id).any(axis=2).ravel()
+        return sum(1 << int(k) for k in np.flatnonzero(used))
+
+    def _repack_lessons(self, instructors_grid, instructor_id):
+        """
+        Tries to move all lessons of the instructor in one class and day to other classes
+        and days when the instructor teaches, days are filled first-fit from the busiest one.
+
+        The first move which increases the cost of self.schedule is kept, self.schedule
+        has to be tracked by _init_cost_state.
+
+        Returns
+        -------
+        bool
+            True if lessons were moved.
+        """
+        teaching = instructors_grid == instructor_id
+        # number of lessons of the instructor in every class and day and in every day
+        lessons_num = teaching.sum(axis=2)
+        days_load = lessons_num.sum(axis=0)
+        days = [d for d in np.argsort(-days_load, kind='stable') if days_load[d] > 0]
+        # time slots when instructor is teaching in any class
+        instructor_busy = teaching.any(axis=0)
+
+        # try to empty classes and days starting from the ones with the fewest lessons
+        sources = sorted(zip(*np.nonzero(lessons_num)), key=lambda source: lessons_num[source])
+        for c_source, d_source in sources:
+            free = (self.schedule < 0) & ~instructor_busy
+            class_used = (self.schedule >= 0).any(axis=2)
+            moves = list()
+            for ts in np.flatnonzero(teaching[c_source, d_source]):
+                # classes already used in the day are preferred, so no new class is rented
+                target = next(((c, d, int(t)) for d in days
+                               for c in sorted(range(self.class_num), key=lambda c: not class_used[c, d])
+                               if (c, d) != (c_source, d_source) for t in np.flatnonzero(free[c, d])), None)
+                if target is None:
+                    break
+                # instructor can not teach two lessons in the same time slot
+                free[:, target[1], target[2]] = False
+                class_used[target[0], target[1]] = True
+                moves.append(((c_source, d_source, ts), target))
+            if len(moves) < lessons_num[c_source, d_source]:
+                continue
+
+            changes = list()
+            for src, dst in moves:
+                src_id = (src[0] * self.day_num + src[1]) * self.time_slot_num + src[2]
+                dst_id = (dst[0] * self.day_num + dst[1]) * self.time_slot_num + dst[2]
+                self._set_lesson(self.schedule, dst_id, self.schedule[src], changes)
+                self._set_lesson(self.schedule, src_id, -1, changes)
+            if self._apply_changes(changes) > 0:
+                return True
+            # revert moves which do not increase earnings
+            self._revert_changes(self.schedule, changes)
+        return False
+
+    def get_lesson_id(self, lesson: Lesson):
+        """
+        Returns id of the lesson - its index in self.lessons.
+
+        Lesson is added to self.lessons unless an equal lesson (same lesson type,
+        participants and instructor) is already there.
+
+        ...
+        Parameters
+        ----------
+        lesson: Lesson
+            Lesson which id is returned.
+
+        Returns
+        -------
+        int
+            Index of the lesson in self.lessons.
+        """
+        key = (lesson.lesson_type, lesson.participant_ids.tobytes(), lesson.instructor_id)
+        if key not in self._lesson_ids:
+            if len(self.lessons) > np.iinfo(LESSON_ID_DTYPE).max:
+                raise OverflowError(f"Too many lessons to store their ids as {np.dtype(LESSON_ID_DTYPE)}")
+            self._lesson_ids[key] = len(self.lessons)
+            self.lessons.append(lesson)
+        return self._lesson_ids[key]
+
+    def _get_lesson_tables(self):
+        """
+        Returns arrays of instructors' ids, numbers of participants and mismatches between lesson type
+        and qualifications of instructor (1 if instructor is not qualified) of lessons, indexed by lesson ids.
+
+        Arrays are rebuilt only after new lessons are added to self.lessons.
+        """
+        if self._lesson_tables is None or self._lesson_tables[0].shape[0] != len(self.lessons):
+            self._lesson_tables = (
+                np.array([lesson.instructor_id for lesson in self.lessons], dtype=np.int32),
+                np.array([lesson.n_participants for lesson in self.lessons], dtype=np.int32),
+                np.array([not lesson.instructor.training_mask >> lesson.lesson_type.value & 1
+                          for lesson in self.lessons], dtype=np.int32))
+        return self._lesson_tables
+
+    def update_classroom_views(self):
+        """
+        Stores schedule of every classroom flattened time slot by time slot
+        (all days of first time slot, then all days of second time slot, etc.)
+        in self.classroom_views. Has to be called after every change of self.schedule.
+        """
+        self.classroom_views = [self.schedule[c].T.ravel() for c in range(self.schedule.shape[0])]
 
     def __str__(self):
         """
@@ -721,13 +1079,318 @@ class Schedule:
                 result += "\n" + days[d] + "\n\n"
                 for ts in range(self.schedule.shape[2]):
                     result += hour[ts] + "\t"
-                    if self.schedule[c, d, ts] is None:
+                    if self.schedule[c, d, ts] < 0:
                         result += "Free\n"
                     else:
-                        result += str(self.schedule[c, d, ts]) + "\n"
+                        result += str(self.lessons[self.schedule[c, d, ts]]) + "\n"
 
         return result
 
+
+@njit(cache=True)
+def _cost_kernel(lesson_ids, lesson_instructors, lesson_participants, lesson_unmatched, instructors_num,
+                 ticket_cost, hour_pay, pay_for_presence, class_renting_cost,
+                 use_penalty_method, penalty_for_repeated, penalty_for_unmatched):
+    """
+    Calculates cost of the solution given as an array of lesson ids (-1 for a free time slot),
+    equivalent of Schedule.get_cost method.
+    """
+    class_num, day_num, time_slot_num = lesson_ids.shape
+    participants_sum = 0
+    instructors_hours = np.zeros((instructors_num, day_num), dtype=np.int64)
+    class_per_day = np.zeros((class_num, day_num), dtype=np.int64)
+    used_instructors = np.zeros(instructors_num, dtype=np.int64)
+    repeated_instructors = 0
+    unmatched_instructors = 0
+
+    for d in range(day_num):
+        for ts in range(time_slot_num):
+            for c in range(class_num):
+                lesson = lesson_ids[c, d, ts]
+                if lesson >= 0:
+                    instructor = lesson_instructors[lesson]
+                    unmatched_instructors += lesson_unmatched[lesson]
+                    if used_instructors[instructor] > 0:
+                        repeated_instructors += 1
+                    used_instructors[instructor] += 1
+                    participants_sum += lesson_participants[lesson]
+                    instructors_hours[instructor, d] += 1
+                    class_per_day[c, d] = 1
+            # clearing instructors used in this time slot
+            for c in range(class_num):
+                if lesson_ids[c, d, ts] >= 0:
+                    used_instructors[lesson_instructors[lesson_ids[c, d, ts]]] = 0
+
+    cost = ticket_cost * participants_sum - \
+        hour_pay * instructors_hours.sum() - \
+        pay_for_presence * (instructors_hours > 0).sum() - \
+        class_renting_cost * class_per_day.sum()
+    if use_penalty_method:
+        cost -= unmatched_instructors * penalty_for_unmatched + \
+            repeated_instructors * penalty_for_repeated
+    return float(cost)
+
+
+@njit(cache=True)
+def _get_temperature(cooling, initial_temp, alpha, temp_step):
+    """
+    Returns temperature after temp_step decreases for the cooling schedule
+    given as a value from COOLING_SCHEDULES.
+    """
+    if cooling == 1:
+        return initial_temp / (1 + alpha * temp_step)
+    if cooling == 2:
+        return initial_temp / (1 + alpha * math.log(1 + temp_step))
+    return initial_temp * alpha ** temp_step
+
+
+def _get_temp_step_bound(cooling, initial_temp, alpha, min_temp):
+    """
+    Returns upper bound of the number of temperature decreases processed before
+    the temperature of the cooling schedule drops to min_temp.
+    """
+    if initial_temp <= min_temp:
+        return 1
+    if min_temp <= 0 or alpha <= 0 or (cooling == 0 and alpha >= 1):
+        return MAX_PREALLOCATED_COSTS
+    ratio = initial_temp / min_temp
+    if cooling == 1:
+        steps = (ratio - 1) / alpha
+    elif cooling == 2:
+        steps = math.expm1(min((ratio - 1) / alpha, math.log(MAX_PREALLOCATED_COSTS)))
+    else:
+        steps = math.log(ratio) / -math.log(alpha)
+    return min(int(math.ceil(steps)) + 1, MAX_PREALLOCATED_COSTS)
+
+
+@njit(cache=True)
+def _count_lesson_kernel(c, d, ts, lesson, sign, instructor_day_lessons, instructor_ts_lessons, class_day_lessons,
+                         lesson_instructors, lesson_participants, lesson_unmatched, ticket_cost, hour_pay,
+                         pay_for_presence, class_renting_cost, use_penalty_method, penalty_for_repeated,
+                         penalty_for_unmatched):
+    """
+    Adds (sign=1) or removes (sign=-1) lesson placed in class c, day d and time slot ts
+    from the counters of lessons and returns the change of the cost, equivalent of Schedule._count_lesson method.
+    """
+    instructor = lesson_instructors[lesson]
+    delta = sign * (ticket_cost * lesson_participants[lesson] - hour_pay)
+    # presence of instructor and renting of classroom are paid for each day they are used
+    day_lessons = instructor_day_lessons[instructor, d]
+    delta -= pay_for_presence * (min(day_lessons + sign, 1) - min(day_lessons, 1))
+    class_lessons = class_day_lessons[c, d]
+    delta -= class_renting_cost * (min(class_lessons + sign, 1) - min(class_lessons, 1))
+    if use_penalty_method:
+        delta -= sign * lesson_unmatched[lesson] * penalty_for_unmatched
+        ts_lessons = instructor_ts_lessons[instructor, d, ts]
+        delta -= penalty_for_repeated * (max(ts_lessons + sign - 1, 0) - max(ts_lessons - 1, 0))
+
+    instructor_day_lessons[instructor, d] += sign
+    instructor_ts_lessons[instructor, d, ts] += sign
+    class_day_lessons[c, d] += sign
+    return float(delta)
+
+
+@njit(cache=True, fastmath=True)
+def _sa_kernel(current_solution, best_solution, lesson_instructors, lesson_participants, lesson_unmatched,
+               instructors_num, ticket_cost, hour_pay, pay_for_presence, class_renting_cost,
+               use_penalty_method, penalty_for_repeated, penalty_for_unmatched,
+               cooling, alpha, initial_temp, n_iter_one_temp, min_temp, epsilon, n_iter_without_improvement,
+               move_num, temp_step, counter, current_cost, best_cost, temp_step_num, all_costs, seed):
+    """
+    Simulated Annealing loop operating on arrays of lesson ids (-1 for a free time slot).
+
+    Processes at most temp_step_num temperature levels, current_solution and best_solution
+    are updated in place and the state of the algorithm is returned, so the next call
+    continues the optimization. Costs of processed iterations are stored in all_costs.
+    Neighbor is generated by moving move_num random lessons to random free time slots,
+    its cost is computed from the changes of the counters of lessons and rejected neighbor is reverted.
+
+    Returns
+    -------
+    tuple
+        Tuple (temp_step, counter, current_cost, best_cost, iter_num, finished), where iter_num
+        is the number of processed iterations and finished is True if a stopping criterion is fulfilled.
+    """
+    if seed >= 0:
+        np.random.seed(seed)
+    # flat view of current_solution used to draw time slots
+    flat_solution = current_solution.reshape(-1)
+
+    # lists of occupied and free time slots, updated after every move
+    occupied = np.flatnonzero(flat_solution >= 0)
+    free = np.flatnonzero(flat_solution < 0)
+    moves = np.empty((move_num, 2), dtype=np.int64)
+
+    # counters of lessons of every instructor in every day and time slot and of every classroom in every day
+    class_num, day_num, time_slot_num = current_solution.shape
+    instructor_day_lessons = np.zeros((instructors_num, day_num), dtype=np.int64)
+    instructor_ts_lessons = np.zeros((instructors_num, day_num, time_slot_num), dtype=np.int64)
+    class_day_lessons = np.zeros((class_num, day_num), dtype=np.int64)
+    for i in range(occupied.shape[0]):
+        idx = occupied[i]
+        instructor = lesson_instructors[flat_solution[idx]]
+        d = idx // time_slot_num % day_num
+        instructor_day_lessons[instructor, d] += 1
+        instructor_ts_lessons[instructor, d, idx % time_slot_num] += 1
+        class_day_lessons[idx // (day_num * time_slot_num), d] += 1
+
+    current_temp = _get_temperature(cooling, initial_temp, alpha, temp_step)
+    iter_num = 0
+
+    if occupied.shape[0] == 0 or free.shape[0] == 0:
+        return temp_step, counter, current_cost, best_cost, iter_num, True
+
+    for step in range(temp_step_num):
+        if current_temp <= min_temp or counter >= n_iter_without_improvement:
+            return temp_step, counter, current_cost, best_cost, iter_num, True
+
+        inv_temp = 1.0 / current_temp
+        for j in range(n_iter_one_temp):
+            # generating neighbor - moving lessons to free time slots
+            delta = 0.0
+            for m in range(move_num):
+                i_occupied = np.random.randint(occupied.shape[0])
+                i_free = np.random.randint(free.shape[0])
+                moves[m, 0] = i_occupied
+                moves[m, 1] = i_free
+                src = occupied[i_occupied]
+                dst = free[i_free]
+                lesson = flat_solution[src]
+                delta += _count_lesson_kernel(
+                    src // (day_num * time_slot_num), src // time_slot_num % day_num, src % time_slot_num,
+                    lesson, -1, instructor_day_lessons, instructor_ts_lessons, class_day_lessons,
+                    lesson_instructors, lesson_participants, lesson_unmatched, ticket_cost, hour_pay,
+                    pay_for_presence, class_renting_cost, use_penalty_method, penalty_for_repeated,
+                    penalty_for_unmatched)
+                delta += _count_lesson_kernel(
+                    dst // (day_num * time_slot_num), dst // time_slot_num % day_num, dst % time_slot_num,
+                    lesson, 1, instructor_day_lessons, instructor_ts_lessons, class_day_lessons,
+                    lesson_instructors, lesson_participants, lesson_unmatched, ticket_cost, hour_pay,
+                    pay_for_presence, class_renting_cost, use_penalty_method, penalty_for_repeated,
+                    penalty_for_unmatched)
+                flat_solution[dst] = lesson
+                flat_solution[src] = -1
+                occupied[i_occupied] = dst
+                free[i_free] = src
+
+            if delta >= 0 or np.random.random() < math.exp(delta * inv_temp):
+                current_cost += delta
+                if current_cost > best_cost:
+                    best_solution[:] = current_solution
+                    best_cost = current_cost
+            else:
+                # reverting moves in reversed order
+                for m in range(move_num - 1, -1, -1):
+                    i_occupied = moves[m, 0]
+                    i_free = moves[m, 1]
+                    src = free[i_free]
+                    dst = occupied[i_occupied]
+                    lesson = flat_solution[dst]
+                    _count_lesson_kernel(
+                        dst // (day_num * time_slot_num), dst // time_slot_num % day_num, dst % time_slot_num,
+                        lesson, -1, instructor_day_lessons, instructor_ts_lessons, class_day_lessons,
+                        lesson_instructors, lesson_participants, lesson_unmatched, ticket_cost, hour_pay,
+                        pay_for_presence, class_renting_cost, use_penalty_method, penalty_for_repeated,
+                        penalty_for_unmatched)
+                    _count_lesson_kernel(
+                        src // (day_num * time_slot_num), src // time_slot_num % day_num, src % time_slot_num,
+                        lesson, 1, instructor_day_lessons, instructor_ts_lessons, class_day_lessons,
+                        lesson_instructors, lesson_participants, lesson_unmatched, ticket_cost, hour_pay,
+                        pay_for_presence, class_renting_cost, use_penalty_method, penalty_for_repeated,
+                        penalty_for_unmatched)
+                    flat_solution[src] = lesson
+                    flat_solution[dst] = -1
+                    occupied[i_occupied] = src
+                    free[i_free] = dst
+
+            all_costs[iter_num] = current_cost
+            iter_num += 1
+        # decrease temperature
+        temp_step += 1
+        current_temp = _get_temperature(cooling, initial_temp, alpha, temp_step)
+        # check if new solution gives different cost - 2nd stopping criteria
+        if abs(current_cost - best_cost) < epsilon:
+            counter += 1
+        else:
+            counter = 0
+
+    finished = current_temp <= min_temp or counter >= n_iter_without_improvement
+    return temp_step, counter, current_cost, best_cost, iter_num, finished
+
+
+# event which stops simulated annealing in the worker process, set by _init_sa_worker
+_stop_event = None
+
+
+def _init_sa_worker(stop_event):
+    """
+    Initializer of the worker processes, stores the event used to stop the optimization.
+    """
+    global _stop_event
+    _stop_event = stop_event
+
+
+def _sa_worker(args):
+    """
+    Runs one independent simulated annealing chain.
+
+    Defined on the module level, so it can be sent to the worker processes.
+
+    ...
+    Parameters
+    ----------
+    args: tuple
+        Tuple (seed, schedule, sa_parameters), where seed initializes random generators,
+        schedule is the Schedule to optimize and sa_parameters are keyword arguments
+        passed to the simulated_annealing method.
+
+    Returns
+    -------
+    tuple
+        Tuple (best_cost, schedule, total_counter, all_costs) of the chain.
+    """
+    seed, schedule, sa_parameters = args
+    random.seed(seed)
+    np.random.seed(seed)
+    should_stop = _stop_event.is_set if _stop_event is not None else None
+    best_cost, total_counter, all_costs = schedule.simulated_annealing(should_stop=should_stop, **sa_parameters)
+    return best_cost, schedule, total_counter, all_costs
+
+
+def simulated_annealing_replicas(schedule, n_replicas=None, stop_event=None, **sa_parameters):
+    """
+    Runs independent simulated annealing chains in separate processes and keeps the best one.
+
+    Chains start from the same schedule with different random seeds, with initial_solution=False
+    every chain starts from its own random schedule. Pool uses the default start method of
+    the platform, so the main module is not imported again by the workers where fork is available.
+
+    ...
+    Parameters
+    ----------
+    schedule: Schedule
+        Schedule to optimize, it is not modified.
+    n_replicas: int, default=None
+        Number of chains, by default equal to the number of CPUs.
+    stop_event: multiprocessing.Event, default=None
+        If given, chains are stopped after the current temperature level when it is set,
+        or after up to KERNEL_TEMP_STEPS levels when the compiled kernel is used.
+    sa_parameters:
+        Keyword arguments passed to the simulated_annealing method.
+
+    Returns
+    -------
+    tuple
+        Tuple (best_cost, schedule, total_counter, all_costs) of the chain with the highest earnings.
+    """
+    if n_replicas is None:
+        n_replicas = os.cpu_count() or 1
+    n_replicas = max(1, n_replicas)
+    seeds = [random.randrange(2 ** 32) for _ in range(n_replicas)]
+    with multiprocessing.Pool(n_replicas, initializer=_init_sa_worker, initargs=(stop_event,)) as pool:
+        results = pool.map(_sa_worker, [(seed, schedule, sa_parameters) for seed in seeds])
+    return max(results, key=lambda result: result[0])
+
 #
 # SM = Schedule(client_file='./client_data/form_answers_2.csv',
 #                 instructor_file='./instructor_data/instructors_info_2.csv',